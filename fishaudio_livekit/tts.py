@@ -10,12 +10,14 @@ from __future__ import annotations
 import asyncio
 import contextlib
 import os
-import uuid
-from array import array
+import secrets
+import threading
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
 
 import httpx
+import numpy as np
 import ormsgpack
 from fish_audio_sdk import Prosody, TTSRequest, WebSocketSession
 from httpx_ws import (
@@ -38,6 +40,15 @@ SAMPLE_RATE = 44100
 NUM_CHANNELS = 1
 PCM_MIME_TYPE = "audio/pcm"
 DEFAULT_FADE_MS = 220
+COURIER_QUEUE_SIZE = 8
+
+# control events carry no payload, so pack them once
+_FLUSH_PACKED = ormsgpack.packb({"event": "flush"})
+_STOP_PACKED = ormsgpack.packb({"event": "stop"})
+
+# msgpack bytes of {"event": "audio", "audio": ...} up to the bin header
+_AUDIO_PREFIX = ormsgpack.packb({"event": "audio", "audio": b""})[:-2]
+_BIN_LENGTH_WIDTHS = {0xC4: 1, 0xC5: 2, 0xC6: 4}  # bin8 / bin16 / bin32
 
 
 @dataclass
@@ -54,6 +65,31 @@ class _TTSOptions:
     sample_rate: int = SAMPLE_RATE
 
 
+def _audio_payload(message: bytes) -> memoryview | None:
+    """Return a view of a bare audio event's payload, or ``None`` to unpack."""
+    offset = len(_AUDIO_PREFIX)
+    if len(message) <= offset or not message.startswith(_AUDIO_PREFIX):
+        return None
+    width = _BIN_LENGTH_WIDTHS.get(message[offset])
+    if width is None:
+        return None
+    start = offset + 1 + width
+    size = int.from_bytes(message[offset + 1 : start], "big")
+    if start + size != len(message):
+        return None
+    return memoryview(message)[start:]
+
+
+@lru_cache(maxsize=16)
+def _fade_ramp(sample_rate: int, duration_ms: int) -> np.ndarray:
+    """Shared Q15 raised-cosine fade-in gains for one rate and duration."""
+    frames = max(0, int(sample_rate * duration_ms / 1000))
+    t = np.arange(frames) / max(frames, 1)
+    ramp = np.round((0.5 - 0.5 * np.cos(np.pi * t)) * 32767).astype(np.int16)
+    ramp.setflags(write=False)
+    return ramp
+
+
 class _FadeInProcessor:
     """Gradually ramps in the first few PCM frames to avoid startup pops."""
 
@@ -70,40 +106,40 @@ class _FadeInProcessor:
         if frame_width <= 0:
             raise ValueError("invalid frame width for fade-in processor")
         self._frame_width = frame_width
-        frames = max(0, int(sample_rate * duration_ms / 1000))
-        self._fade_frames = frames
+        self._ramp = _fade_ramp(sample_rate, duration_ms)
+        self._fade_frames = len(self._ramp)
         self._processed_frames = 0
+        if self._fade_frames <= 0:
+            self.process = bytes
 
-    def process(self, chunk: bytes) -> bytes:
-        if not chunk or self._fade_frames <= 0:
-            return chunk
+    def process(self, chunk: bytes | memoryview) -> bytes:
+        if not chunk:
+            return bytes(chunk)
         if len(chunk) % self._frame_width != 0:
-            return chunk  # avoid corrupting misaligned buffers
+            return bytes(chunk)  # avoid corrupting misaligned buffers
 
         frame_count = len(chunk) // self._frame_width
-        if self._processed_frames >= self._fade_frames or frame_count == 0:
-            self._processed_frames += frame_count
-            return chunk
-
-        fade_remaining = self._fade_frames - self._processed_frames
-        apply_frames = min(frame_count, fade_remaining)
-        if apply_frames <= 0:
-            self._processed_frames += frame_count
-            return chunk
-
-        samples = array("h")
-        samples.frombytes(chunk)
         start_frame = self._processed_frames
-        for frame_idx in range(apply_frames):
-            fade_position = start_frame + frame_idx
-            factor = min(fade_position / self._fade_frames, 1.0)
-            base_index = frame_idx * self._num_channels
-            for channel in range(self._num_channels):
-                idx = base_index + channel
-                samples[idx] = int(samples[idx] * factor)
+        apply_frames = min(frame_count, self._fade_frames - start_frame)
+
+        buf = bytearray(chunk)
+        samples = np.frombuffer(buf, dtype=np.int16)
+        window = samples[: apply_frames * self._num_channels].reshape(
+            -1, self._num_channels
+        )
+        ramp = self._ramp[start_frame : start_frame + apply_frames, np.newaxis]
+        scaled = window.astype(np.int32)
+        scaled *= ramp
+        scaled >>= 15
+        window[:] = scaled
 
         self._processed_frames += frame_count
-        return samples.tobytes()
+        if self._processed_frames >= self._fade_frames:
+            # fade window is done; later chunks skip all of the above.
+            # bytes() returns bytes input as-is and copies memoryviews, which
+            # the emitter would otherwise drop. It holds no reference to self.
+            self.process = bytes
+        return bytes(buf)
 
 
 class ChunkedStream(lk_tts.ChunkedStream):
@@ -117,56 +153,60 @@ class ChunkedStream(lk_tts.ChunkedStream):
         conn_options: APIConnectOptions,
         opts: _TTSOptions,
         ws: WebSocketSession,
+        request_template: TTSRequest,
         fade_duration_ms: Optional[int],
     ) -> None:
         super().__init__(tts=tts, input_text=input_text, conn_options=conn_options)
         self._ws = ws
         self._opts = opts
+        self._request_template = request_template
         self._fade_duration_ms = fade_duration_ms
 
     async def _run(self, output_emitter: lk_tts.AudioEmitter) -> None:  # noqa: D401
-        request_id = str(uuid.uuid4().hex)[:12]
-        fade_processor = (
-            _FadeInProcessor(
+        request_id = secrets.token_hex(6)
+        if self._fade_duration_ms is None:
+            push = output_emitter.push
+        else:
+            fade_processor = _FadeInProcessor(
                 sample_rate=self._opts.sample_rate,
                 num_channels=NUM_CHANNELS,
                 duration_ms=self._fade_duration_ms,
             )
-            if self._fade_duration_ms and self._fade_duration_ms > 0
-            else None
-        )
-        try:
-            request_kwargs = {
-                "text": self.input_text,
-                "reference_id": self._opts.reference_id,
-                "format": "pcm",
-                "temperature": self._opts.temperature,
-                "top_p": self._opts.top_p,
-                "sample_rate": self._opts.sample_rate,
-                "prosody": Prosody(
-                    speed=self._opts.speed,
-                    volume=self._opts.volume,
-                ),
-            }
-            if self._opts.chunk_length is not None:
-                request_kwargs["chunk_length"] = self._opts.chunk_length
-            if self._opts.latency is not None:
-                request_kwargs["latency"] = self._opts.latency
 
-            tts_request = TTSRequest(**request_kwargs)
+            def push(chunk: bytes) -> None:
+                output_emitter.push(fade_processor.process(chunk))
+
+        try:
+            tts_request = self._request_template.model_copy(
+                update={"text": self.input_text}
+            )
 
             loop = asyncio.get_running_loop()
             courier_queue: asyncio.Queue = asyncio.Queue()
             sentinel = object()
+            # one slot per queued item; the consumer releases a slot per get
+            slots = threading.BoundedSemaphore(COURIER_QUEUE_SIZE)
+            stopped = threading.Event()
+
+            def put(item: object) -> None:
+                # blocks the worker thread only while the queue is full
+                while not stopped.is_set():
+                    if slots.acquire(timeout=0.1):
+                        break
+                if stopped.is_set():
+                    return
+                loop.call_soon_threadsafe(courier_queue.put_nowait, item)
 
             def run_tts() -> None:
                 try:
                     for chunk in self._ws.tts(tts_request, [], backend=self._opts.model):
-                        loop.call_soon_threadsafe(courier_queue.put_nowait, chunk)
+                        if stopped.is_set():
+                            break
+                        put(chunk)
                 except Exception as exc:  # pragma: no cover
-                    loop.call_soon_threadsafe(courier_queue.put_nowait, exc)
+                    put(exc)
                 finally:
-                    loop.call_soon_threadsafe(courier_queue.put_nowait, sentinel)
+                    put(sentinel)
 
             worker = loop.run_in_executor(None, run_tts)
 
@@ -177,20 +217,33 @@ class ChunkedStream(lk_tts.ChunkedStream):
                 mime_type=PCM_MIME_TYPE,
             )
             error: Exception | None = None
-            while True:
-                item = await courier_queue.get()
+
+            def handle(item: object) -> bool:
+                nonlocal error
+                slots.release()
                 if item is sentinel:
-                    break
+                    return False
                 if isinstance(item, Exception):
                     error = item
-                    continue
-                if error is None:
-                    processed = (
-                        fade_processor.process(item) if fade_processor else item
-                    )
-                    output_emitter.push(processed)
+                elif error is None:
+                    push(item)
+                return True
+
+            try:
+                running = True
+                while running:
+                    running = handle(await courier_queue.get())
+                    # drain whatever else is already queued in the same wakeup
+                    while running and not courier_queue.empty():
+                        running = handle(courier_queue.get_nowait())
+
+                await worker
+            finally:
+                # release a worker that is still blocked on a full queue
+                stopped.set()
+                with contextlib.suppress(ValueError):
+                    slots.release()
 
-            await worker
             if error is not None:
                 raise error
             output_emitter.end_input()
@@ -209,25 +262,34 @@ class Stream(lk_tts.SynthesizeStream):
         tts: "TTS",
         conn_options: APIConnectOptions,
         opts: _TTSOptions,
-        api_key: str,
+        client: httpx.AsyncClient,
+        start_event: bytes,
         fade_duration_ms: Optional[int],
     ) -> None:
         super().__init__(tts=tts, conn_options=conn_options)
         self._opts = opts
-        self._api_key = api_key
+        self._client = client
+        self._start_event = start_event
         self._fade_duration_ms = fade_duration_ms
 
     async def _run(self, output_emitter: lk_tts.AudioEmitter) -> None:  # noqa: D401
-        request_id = str(uuid.uuid4().hex)[:12]
-        fade_processor = (
-            _FadeInProcessor(
+        request_id = secrets.token_hex(6)
+        if self._fade_duration_ms is None:
+
+            def push(chunk: bytes | memoryview) -> None:
+                # audio sliced by _audio_payload is a memoryview; the emitter
+                # only forwards bytes
+                output_emitter.push(bytes(chunk))
+
+        else:
+            fade_processor = _FadeInProcessor(
                 sample_rate=self._opts.sample_rate,
                 num_channels=NUM_CHANNELS,
                 duration_ms=self._fade_duration_ms,
             )
-            if self._fade_duration_ms and self._fade_duration_ms > 0
-            else None
-        )
+
+            def push(chunk: bytes | memoryview) -> None:
+                output_emitter.push(fade_processor.process(chunk))
 
         output_emitter.initialize(
             request_id=request_id,
@@ -237,32 +299,7 @@ class Stream(lk_tts.SynthesizeStream):
             stream=True,
         )
 
-        request_kwargs = {
-            "text": "",
-            "format": "pcm",
-            "temperature": self._opts.temperature,
-            "top_p": self._opts.top_p,
-            "sample_rate": self._opts.sample_rate,
-            "prosody": Prosody(
-                speed=self._opts.speed,
-                volume=self._opts.volume,
-            ),
-        }
-        if self._opts.reference_id is not None:
-            request_kwargs["reference_id"] = self._opts.reference_id
-        if self._opts.chunk_length is not None:
-            request_kwargs["chunk_length"] = self._opts.chunk_length
-        if self._opts.latency is not None:
-            request_kwargs["latency"] = self._opts.latency
-
-        tts_request = TTSRequest(**request_kwargs).model_dump(exclude_none=True)
-
         timeout = self._conn_options.timeout  # noqa: SLF001
-        client = httpx.AsyncClient(
-            base_url=self.API_BASE_URL,
-            headers={"Authorization": f"Bearer {self._api_key}"},
-            timeout=timeout,
-        )
 
         async def _send_loop(ws) -> None:
             pending: list[str] = []
@@ -283,7 +320,7 @@ class Stream(lk_tts.SynthesizeStream):
                 await ws.send_bytes(
                     ormsgpack.packb({"event": "text", "text": text_raw})
                 )
-                await ws.send_bytes(ormsgpack.packb({"event": "flush"}))
+                await ws.send_bytes(_FLUSH_PACKED)
 
             try:
                 async for item in self._input_ch:  # noqa: SLF001
@@ -296,7 +333,7 @@ class Stream(lk_tts.SynthesizeStream):
 
                 if started:
                     try:
-                        await ws.send_bytes(ormsgpack.packb({"event": "stop"}))
+                        await ws.send_bytes(_STOP_PACKED)
                     except LocalProtocolError:
                         pass
             except Exception:
@@ -310,50 +347,44 @@ class Stream(lk_tts.SynthesizeStream):
                         ws.receive_bytes(),
                         timeout=receive_timeout,
                     )
-                    data = ormsgpack.unpackb(message)
-                    event = data.get("event")
-                    if event == "audio":
-                        chunk = data.get("audio")
-                        if chunk:
-                            processed = (
-                                fade_processor.process(chunk)
-                                if fade_processor
-                                else chunk
-                            )
-                            output_emitter.push(processed)
-                    elif event == "finish":
-                        if data.get("reason") == "error":
-                            raise APIConnectionError()
-                        break
+                    chunk = _audio_payload(message)
+                    if chunk is None:
+                        data = ormsgpack.unpackb(message)
+                        event = data.get("event")
+                        if event == "finish":
+                            if data.get("reason") == "error":
+                                raise APIConnectionError()
+                            break
+                        chunk = data.get("audio") if event == "audio" else None
+                    if chunk:
+                        push(chunk)
             except asyncio.TimeoutError:
                 pass
             except WebSocketDisconnect as exc:
                 raise APIConnectionError() from exc
 
         try:
-            async with client:
-                async with aconnect_ws(
-                    "/v1/tts/live",
-                    client=client,
-                    headers={"model": self._opts.model},
-                ) as ws:
-                    await ws.send_bytes(
-                        ormsgpack.packb({"event": "start", "request": tts_request})
-                    )
+            async with aconnect_ws(
+                "/v1/tts/live",
+                client=self._client,
+                headers={"model": self._opts.model},
+                timeout=timeout,
+            ) as ws:
+                await ws.send_bytes(self._start_event)
 
-                    output_emitter.start_segment(segment_id=request_id)
+                output_emitter.start_segment(segment_id=request_id)
 
-                    send_task = asyncio.create_task(_send_loop(ws))
-                    recv_task = asyncio.create_task(_recv_loop(ws))
+                send_task = asyncio.create_task(_send_loop(ws))
+                recv_task = asyncio.create_task(_recv_loop(ws))
 
-                    try:
-                        await asyncio.gather(send_task, recv_task)
-                    finally:
-                        for task in (send_task, recv_task):
-                            if not task.done():
-                                task.cancel()
-                                with contextlib.suppress(asyncio.CancelledError):
-                                    await task
+                try:
+                    await asyncio.gather(send_task, recv_task)
+                finally:
+                    for task in (send_task, recv_task):
+                        if not task.done():
+                            task.cancel()
+                            with contextlib.suppress(asyncio.CancelledError):
+                                await task
         except (
             httpx.HTTPError,
             asyncio.TimeoutError,
@@ -406,7 +437,49 @@ class TTS(lk_tts.TTS):
         if not self._api_key:
             raise APIConnectionError("FISHAUDIO_API_KEY not set")
         self._ws = WebSocketSession(self._api_key)
-        self._fade_duration_ms = fade_duration_ms
+        # shared across streams so each utterance skips client and SSL context setup
+        self._client = httpx.AsyncClient(
+            base_url=Stream.API_BASE_URL,
+            headers={"Authorization": f"Bearer {self._api_key}"},
+        )
+        # None means no fade; streams then push audio without a processor
+        self._fade_duration_ms = (
+            fade_duration_ms if fade_duration_ms and fade_duration_ms > 0 else None
+        )
+        if self._fade_duration_ms is not None:
+            _fade_ramp(sample_rate, self._fade_duration_ms)  # warm the shared ramp
+        # options are fixed for the lifetime of the TTS, so build the
+        # request once; streams only swap in the text
+        self._request_template = self._build_request_template()
+        self._start_event = ormsgpack.packb(
+            {
+                "event": "start",
+                "request": self._request_template.model_dump(exclude_none=True),
+            }
+        )
+
+    def _build_request_template(self) -> TTSRequest:
+        request_kwargs = {
+            "text": "",
+            "format": "pcm",
+            "temperature": self._opts.temperature,
+            "top_p": self._opts.top_p,
+            "sample_rate": self._opts.sample_rate,
+            "prosody": Prosody(
+                speed=self._opts.speed,
+                volume=self._opts.volume,
+            ),
+        }
+        if self._opts.reference_id is not None:
+            request_kwargs["reference_id"] = self._opts.reference_id
+        if self._opts.chunk_length is not None:
+            request_kwargs["chunk_length"] = self._opts.chunk_length
+        if self._opts.latency is not None:
+            request_kwargs["latency"] = self._opts.latency
+        return TTSRequest(**request_kwargs)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
 
     def synthesize(
         self,
@@ -420,6 +493,7 @@ class TTS(lk_tts.TTS):
             conn_options=conn_options,
             opts=self._opts,
             ws=self._ws,
+            request_template=self._request_template,
             fade_duration_ms=self._fade_duration_ms,
         )
 
@@ -432,6 +506,7 @@ class TTS(lk_tts.TTS):
             tts=self,
             conn_options=conn_options,
             opts=self._opts,
-            api_key=self._api_key,
+            client=self._client,
+            start_event=self._start_event,
             fade_duration_ms=self._fade_duration_ms,
         )